@@ -12,26 +12,38 @@ Endpoints:
 /api/documents
 """
 
+import io
 import os
 import uuid
+import asyncio
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 from dotenv import load_dotenv
 from enum import Enum
+import aiofiles.tempfile
 from markdown_pdf import MarkdownPdf, Section
-from fastapi import FastAPI, UploadFile, File, Form, Query, Request
-from fastapi.responses import RedirectResponse, FileResponse, HTMLResponse
+from fastapi import FastAPI, UploadFile, File, Form, Query, Request, BackgroundTasks
+from fastapi.responses import (
+    RedirectResponse,
+    FileResponse,
+    HTMLResponse,
+    StreamingResponse,
+    Response
+)
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 
-from database import documents_col, sessions_col
+from database import documents_col, sessions_col, ensure_indexes
 from rag_pipeline import (
     generate_notes,
     store_document,
     load_retriever,
     chat_with_transcript
 )
-from transcript_loader import load_transcript
+from transcript_loader import load_transcript_file
 from prompts import get_prompt_template
 
 class NotesFormat(str, Enum):
@@ -56,10 +68,27 @@ class NotesFormat(str, Enum):
 load_dotenv()
 app = FastAPI()
 
-# Configure CORS to allow frontend requests
+
+@app.on_event("startup")
+def create_indexes():
+    ensure_indexes()
+
+
+# Dedicated bounded executor for the CPU-heavy upload path (PDF parse +
+# embedding), so concurrent uploads can't oversubscribe the CPU or starve
+# the threadpool that serves the sync endpoints
+_CPU_EXECUTOR = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1))
+
+# Configure CORS to allow frontend requests; set ALLOWED_ORIGINS to a
+# comma-separated list in production instead of the permissive default
+allowed_origins = [
+    origin.strip()
+    for origin in os.getenv("ALLOWED_ORIGINS", "*").split(",")
+    if origin.strip()
+]
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # In production, replace with specific origins
+    allow_origins=allowed_origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -69,10 +98,15 @@ app.add_middleware(
 FRONTEND_DIR = Path(__file__).parent / "frontend" / "dist"
 FRONTEND_STATIC = Path(__file__).parent / "frontend"  # For static HTML/CSS/JS
 
-uploaded_transcript_text: str = ""
-selected_formats = {}
-notes_download: str = ""
+def _read_index_html() -> bytes | None:
+    # React build takes priority over the static HTML frontend
+    for candidate in (FRONTEND_DIR / "index.html", FRONTEND_STATIC / "index.html"):
+        if candidate.exists():
+            return candidate.read_bytes()
+    return None
 
+# Read once at import so the SPA catch-all doesn't hit the disk per request
+_INDEX_HTML = _read_index_html()
 
 # ============ API ENDPOINTS ============
 
@@ -95,7 +129,13 @@ def get_formats():
 @app.get("/api/documents")
 def list_documents(username: str = Query(...)):
     """List all documents uploaded by a user."""
-    docs = list(documents_col.find({"username": username}))
+    # Project to the handful of fields the frontend shows; the stored
+    # transcript text never leaves the database
+    docs = documents_col.aggregate([
+        {"$match": {"username": username}},
+        {"$sort": {"created_at": -1}},
+        {"$project": {"title": 1, "content_type": 1, "created_at": 1}}
+    ])
     return {
         "documents": [
             {
@@ -114,18 +154,37 @@ def test():
     return {"status": "Ok"}
 
 @app.post("/documents/upload")
-def upload_file(
+async def upload_file(
     username: str = Form(...),
     file: UploadFile = File(...)
 ):
-    text = load_transcript(file)
-
-    document_id = store_document(
-        username=username,
-        title=file.filename,
-        content_type=file.content_type,
-        transcript_text=text
-    )
+    # Stream the upload to disk without blocking the event loop, then push
+    # the CPU-bound work (parsing + embedding) onto the threadpool. The
+    # whole sequence shares one finally so an aborted stream (e.g. client
+    # disconnect mid-upload) can't orphan the partially-written tempfile.
+    tmp_path = None
+    loop = asyncio.get_running_loop()
+    try:
+        async with aiofiles.tempfile.NamedTemporaryFile("wb", delete=False) as tmp:
+            tmp_path = tmp.name
+            while chunk := await file.read(1 << 20):
+                await tmp.write(chunk)
+
+        text = await loop.run_in_executor(
+            _CPU_EXECUTOR, load_transcript_file, tmp_path, file.filename
+        )
+
+        document_id = await loop.run_in_executor(
+            _CPU_EXECUTOR,
+            store_document,
+            username,
+            file.filename,
+            file.content_type,
+            text
+        )
+    finally:
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
 
     return {
         "document_id": document_id,
@@ -175,10 +234,16 @@ def select_formats(
     if format_enum != NotesFormat.type_17:
         custom_format = None
 
-    selected_formats[session_id] = {
-        "notes_format": format_enum,
-        "custom_prompt": custom_format
-    }
+    # Persist the selection on the session document so any worker can read it
+    result = sessions_col.update_one(
+        {"_id": session_id},
+        {"$set": {
+            "notes_format": format_enum.name,
+            "custom_prompt": custom_format
+        }}
+    )
+    if result.matched_count == 0:
+        return {"error": "Invalid session"}
 
     return {
         "message": "Format selected successfully",
@@ -191,18 +256,16 @@ def select_formats(
 def generate_notes_endpoint(
     session_id: str = Form(...)
 ):
-    global notes_download
-    if session_id not in selected_formats:
-        return {"error": "Please select a notes format first using /formats"}
-    
-    data = selected_formats[session_id]
-    notes_format = data["notes_format"]
-    custom_format = data["custom_prompt"]
-
     session = sessions_col.find_one({"_id": session_id})
     if not session:
         return {"error": "Invalid session"}
 
+    if not session.get("notes_format"):
+        return {"error": "Please select a notes format first using /formats"}
+
+    notes_format = NotesFormat[session["notes_format"]]
+    custom_format = session.get("custom_prompt")
+
     prompt_template = get_prompt_template(notes_format, custom_format)
 
     notes = generate_notes(document_id=session["document_id"],
@@ -212,13 +275,17 @@ def generate_notes_endpoint(
                            chunk_overlap=200,
                            retriever_k=5,
                            llm_temperature=0.7)
-    
-    notes_download = notes
+
+    sessions_col.update_one(
+        {"_id": session_id},
+        {"$set": {"notes": notes, "notes_generated_at": datetime.now()}}
+    )
 
     return {"notes": notes}
 
 @app.post("/chat")
 def chat(
+    background_tasks: BackgroundTasks,
     session_id: str = Form(...),
     question: str = Form(...)
 ):
@@ -232,47 +299,69 @@ def chat(
     answer = chat_with_transcript(
         user_query=question,
         session_id=session_id,
-        retriever=retriever
+        retriever=retriever,
+        document_id=session["document_id"],
+        background_tasks=background_tasks
     )
 
     return {"answer": answer}
 
+# Rendered PDFs keyed by sha256 of the notes text; repeated downloads of the
+# same notes skip the markdown -> PDF conversion entirely
+_PDF_CACHE: OrderedDict = OrderedDict()
+_PDF_CACHE_MAX = 32
+
+def _get_session_notes(session_id: str) -> str:
+    session = sessions_col.find_one({"_id": session_id}, {"notes": 1})
+    return (session or {}).get("notes", "")
+
 @app.post("/download/pdf")
 def download_pdf(
+    session_id: str = Form(...),
     pdfname: str = Form(...)
 ):
-    global notes_download
-
-    if not notes_download.strip():
+    notes = _get_session_notes(session_id)
+    if not notes.strip():
         return {"error": "No notes available. Generate notes first"}
 
-    out_path = f"{pdfname}.pdf"
-
-    pdf = MarkdownPdf()
-    pdf.add_section(Section(notes_download, toc=False))
-    pdf.save(out_path)
-
-    return FileResponse(path=out_path, media_type="application/pdf",
-                        filename=os.path.basename(out_path))
+    key = hashlib.sha256(notes.encode("utf-8")).hexdigest()
+
+    pdf_bytes = _PDF_CACHE.get(key)
+    if pdf_bytes is None:
+        # Render straight into memory: no leftover files in CWD and no extra
+        # disk round trip before the response
+        buffer = io.BytesIO()
+        pdf = MarkdownPdf(optimize=True)
+        pdf.add_section(Section(notes, toc=False))
+        pdf.save(buffer)
+        pdf_bytes = buffer.getvalue()
+
+        _PDF_CACHE[key] = pdf_bytes
+        if len(_PDF_CACHE) > _PDF_CACHE_MAX:
+            _PDF_CACHE.popitem(last=False)
+    else:
+        _PDF_CACHE.move_to_end(key)
+
+    return StreamingResponse(
+        io.BytesIO(pdf_bytes),
+        media_type="application/pdf",
+        headers={"Content-Disposition": f'attachment; filename="{pdfname}.pdf"'}
+    )
 
 @app.post("/download/markdown")
 def download_markdown(
+    session_id: str = Form(...),
     mdname: str = Form(...)
 ):
-    global notes_download
-
-    if not notes_download.strip():
+    notes = _get_session_notes(session_id)
+    if not notes.strip():
         return {"error": "No notes available. Generate notes first"}
-    
-    out_path = f"{mdname}.md"
-
-    notes_download = notes_download.strip()
-
-    with open(out_path, "w", encoding="utf-8") as buffer:
-        buffer.write(notes_download)
 
-    return FileResponse(path=out_path, media_type="text/markdown",
-                        filename=os.path.basename(out_path))
+    return StreamingResponse(
+        iter([notes.strip().encode("utf-8")]),
+        media_type="text/markdown",
+        headers={"Content-Disposition": f'attachment; filename="{mdname}.md"'}
+    )
 
 
 # ============ FRONTEND SERVING ============
@@ -303,17 +392,11 @@ if FRONTEND_STATIC.exists():
 def serve_spa(request: Request, full_path: str):
     """
     Catch-all route for SPA.
-    Serves index.html for any path not matched by API routes.
+    Serves the index.html cached at startup for any path not matched
+    by API routes.
     """
-    # Try React build first
-    react_index = FRONTEND_DIR / "index.html"
-    if react_index.exists():
-        return HTMLResponse(content=react_index.read_text(encoding="utf-8"))
-    
-    # Try static HTML frontend
-    static_index = FRONTEND_STATIC / "index.html"
-    if static_index.exists():
-        return HTMLResponse(content=static_index.read_text(encoding="utf-8"))
-    
+    if _INDEX_HTML is not None:
+        return Response(content=_INDEX_HTML, media_type="text/html")
+
     # Fallback to docs if no frontend
     return RedirectResponse(url="/docs")
\ No newline at end of file
@@ -1,4 +1,5 @@
 from pymongo import MongoClient
+from pymongo.errors import PyMongoError
 import os
 from dotenv import load_dotenv
 
@@ -9,4 +10,30 @@ db = client[os.getenv("DB_NAME")]
 
 documents_col = db["documents"]
 sessions_col = db["sessions"]
-messages_col = db["messages"]
\ No newline at end of file
+messages_col = db["messages"]
+answer_cache_col = db["answer_cache"]
+retrieval_cache_col = db["retrieval_cache"]
+
+# How long cache entries live before Mongo expires them server-side
+CACHE_TTL_SECONDS = 7 * 24 * 3600
+
+
+def ensure_indexes():
+    """
+    Create the indexes the app relies on (no-ops if they already exist).
+    Called from the FastAPI startup hook so importing this module stays
+    side-effect-free and a briefly unavailable Mongo can't block boot.
+    """
+    try:
+        # Covers the /api/documents listing query
+        documents_col.create_index([("username", 1), ("created_at", -1)])
+
+        # TTL indexes so the cache collections don't grow without bound
+        answer_cache_col.create_index(
+            "created_at", expireAfterSeconds=CACHE_TTL_SECONDS
+        )
+        retrieval_cache_col.create_index(
+            "created_at", expireAfterSeconds=CACHE_TTL_SECONDS
+        )
+    except PyMongoError as exc:
+        print(f"Warning: could not create indexes: {exc}")
\ No newline at end of file
@@ -606,6 +606,7 @@ async function downloadPdf() {
     if (API_BASE) {
       // Real API call
       const formData = new FormData();
+      formData.append('session_id', appState.sessionId);
       formData.append('pdfname', 'lecture-notes');
       
       const response = await fetch(`${API_BASE}/download/pdf`, {
@@ -643,6 +644,7 @@ async function downloadMarkdown() {
     if (API_BASE) {
       // Real API call
       const formData = new FormData();
+      formData.append('session_id', appState.sessionId);
       formData.append('mdname', 'lecture-notes');
       
       const response = await fetch(`${API_BASE}/download/markdown`, {
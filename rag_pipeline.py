@@ -1,8 +1,17 @@
 import os
 import uuid
+import hashlib
+import threading
+from functools import lru_cache
 from dotenv import load_dotenv
-from datetime import datetime
+from datetime import datetime, timedelta
 
+import faiss
+import numpy as np
+
+from langchain_classic.embeddings import CacheBackedEmbeddings
+from langchain_classic.storage import LocalFileStore
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
 from langchain_community.embeddings import SentenceTransformerEmbeddings
 from langchain_core.documents import Document
@@ -10,16 +19,168 @@ from langchain_text_splitters import TokenTextSplitter
 
 from langchain_groq import ChatGroq
 from langchain_core.messages import SystemMessage, HumanMessage
-from langchain_core.prompts import ChatPromptTemplate
-
-from database import documents_col, sessions_col, messages_col
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.globals import set_llm_cache
+from langchain_community.cache import SQLiteCache
+
+from database import (
+    documents_col,
+    sessions_col,
+    messages_col,
+    answer_cache_col,
+    retrieval_cache_col
+)
 
 load_dotenv(dotenv_path=".env")
 
+# Exact-match LLM cache shared by every ChatGroq instance: repeat prompts
+# (same model + temperature) are served from sqlite instead of the API.
+set_llm_cache(SQLiteCache(database_path=".llm_cache.db"))
+
 FAISS_DIR = "faiss"
 os.makedirs(FAISS_DIR, exist_ok=True)
 
-embedding_model = SentenceTransformerEmbeddings(model_name="all-MiniLM-L12-v2")
+# Cache embeddings on disk keyed by text hash, so previously-seen chunks and
+# queries skip the encoder forward pass entirely. Queries must be normalized
+# exactly like the stored chunk vectors, or L2 distances against the index
+# are skewed; the namespace is bumped so unnormalized cache entries from
+# before this change are never reused.
+embedding_store = LocalFileStore("./emb_cache/")
+embedding_model = CacheBackedEmbeddings.from_bytes_store(
+    underlying_embeddings=SentenceTransformerEmbeddings(
+        model_name="all-MiniLM-L12-v2",
+        encode_kwargs={"normalize_embeddings": True}
+    ),
+    document_embedding_cache=embedding_store,
+    namespace="all-MiniLM-L12-v2-normalized",
+    query_embedding_cache=True
+)
+
+# Direct handle on the already-loaded SentenceTransformer for batched
+# encoding at upload time (one matmul per batch instead of N serial wrapper
+# calls); reusing it avoids holding a second copy of the model in memory.
+st_model = embedding_model.underlying_embeddings.client
+
+class SemanticAnswerCache:
+    """
+    Per-session semantic cache of (query embedding -> answer) pairs.
+
+    Repeated or paraphrased questions are answered straight from the cache
+    (a single FAISS lookup) instead of re-running retrieval and the LLM call.
+    Entries are persisted in Mongo (answer_cache) so they survive restarts,
+    and are dropped when the underlying document changes.
+    """
+
+    def __init__(self, similarity_threshold=0.92):
+        self.similarity_threshold = similarity_threshold
+        # /chat runs on worker threads, and FAISS add/search on one index
+        # isn't thread-safe, so all per-session state is guarded here
+        self._lock = threading.Lock()
+        self._indexes = {}   # session_id -> faiss.IndexFlatIP
+        self._answers = {}   # session_id -> list of answer strings
+
+    @staticmethod
+    def _normalize(embedding):
+        vec = np.asarray(embedding, dtype="float32").reshape(1, -1)
+        faiss.normalize_L2(vec)
+        return vec
+
+    @staticmethod
+    def _document_version(document_id):
+        doc = documents_col.find_one({"_id": document_id}, {"updated_at": 1, "created_at": 1})
+        if not doc:
+            return None
+        version = doc.get("updated_at") or doc.get("created_at")
+        return version.isoformat() if version else None
+
+    def _load_session(self, session_id):
+        """Rebuild the in-memory index for a session from Mongo.
+
+        Caller must hold self._lock.
+        """
+        self._answers[session_id] = []
+        index = None
+
+        entries = list(answer_cache_col.find({"session_id": session_id}))
+
+        # One version lookup per distinct document, not per cached entry
+        versions = {
+            doc_id: self._document_version(doc_id)
+            for doc_id in {e.get("document_id") for e in entries}
+        }
+
+        stale_ids = []
+        for entry in entries:
+            if entry.get("doc_version") != versions[entry.get("document_id")]:
+                # Document changed since the answer was cached -> stale
+                stale_ids.append(entry["_id"])
+                continue
+
+            vec = self._normalize(entry["query_embedding"])
+            if index is None:
+                index = faiss.IndexFlatIP(vec.shape[1])
+            index.add(vec)
+            self._answers[session_id].append(entry["answer"])
+
+        if stale_ids:
+            answer_cache_col.delete_many({"_id": {"$in": stale_ids}})
+
+        self._indexes[session_id] = index
+        return index
+
+    def lookup(self, session_id, query_embedding):
+        vec = self._normalize(query_embedding)
+
+        with self._lock:
+            if session_id not in self._indexes:
+                self._load_session(session_id)
+
+            index = self._indexes[session_id]
+            if index is None or index.ntotal == 0:
+                return None
+
+            scores, ids = index.search(vec, 1)
+            if scores[0][0] >= self.similarity_threshold:
+                return self._answers[session_id][ids[0][0]]
+        return None
+
+    def add(self, session_id, document_id, query_embedding, answer):
+        vec = self._normalize(query_embedding)
+
+        with self._lock:
+            if session_id not in self._indexes:
+                self._load_session(session_id)
+
+            if self._indexes[session_id] is None:
+                self._indexes[session_id] = faiss.IndexFlatIP(vec.shape[1])
+
+            self._indexes[session_id].add(vec)
+            self._answers[session_id].append(answer)
+
+        # Mongo write happens outside the lock so a slow insert doesn't
+        # block lookups for other sessions
+        answer_cache_col.insert_one({
+            "_id": str(uuid.uuid4()),
+            "session_id": session_id,
+            "document_id": document_id,
+            "query_embedding": vec[0].tolist(),
+            "answer": answer,
+            "doc_version": self._document_version(document_id),
+            "created_at": datetime.now()
+        })
+
+answer_cache = SemanticAnswerCache()
+
+# Only the last K turns are fed back into the prompt; full history stays in Mongo
+CHAT_HISTORY_TURNS = 6
+
+# Built once at import instead of re-assembling the template per request
+RAG_CHAT_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "Answer strictly using the provided context."),
+    ("system", "Context:\n{context}"),
+    MessagesPlaceholder("history"),
+    ("human", "{question}")
+])
 
 def chunk_text(text, chunk_size=1000, chunk_overlap=200):
     splitter = TokenTextSplitter(chunk_size=chunk_size,chunk_overlap=chunk_overlap)
@@ -28,22 +189,134 @@ def chunk_text(text, chunk_size=1000, chunk_overlap=200):
 def get_vectorstore(docs):
     return FAISS.from_documents(docs, embedding=embedding_model)
 
+def build_vectorstore(chunks, vectors):
+    """
+    Build a FAISS vectorstore over an int8-quantized HNSW graph index
+    instead of the exact-scan IndexFlatL2 that FAISS.from_documents
+    defaults to: approximate search keeps query time roughly logarithmic
+    as the corpus grows, and 8-bit scalar quantization stores vectors at
+    a quarter of the fp32 footprint with negligible recall loss on
+    normalized MiniLM embeddings. Queries arrive fp32 but unit-normalized
+    like the stored vectors (embedding_model normalizes both sides);
+    FAISS handles the int8/fp32 comparison internally.
+    """
+    vecs = np.asarray(vectors, dtype="float32")
+
+    index = faiss.IndexHNSWSQ(vecs.shape[1], faiss.ScalarQuantizer.QT_8bit, 32)
+    index.hnsw.efConstruction = 200
+    index.hnsw.efSearch = 64
+    index.train(vecs)
+    index.add(vecs)
+
+    docstore = InMemoryDocstore({str(i): chunk for i, chunk in enumerate(chunks)})
+
+    return FAISS(
+        embedding_function=embedding_model,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id={i: str(i) for i in range(len(chunks))}
+    )
+
+@lru_cache(maxsize=8)
 def get_llm(temperature=0.7):
+    # Point VLLM_BASE_URL at a local `vllm serve ... --enable-prefix-caching`
+    # endpoint to reuse the KV cache of repeated document contexts; the
+    # default stays hosted Groq.
+    vllm_base_url = os.getenv("VLLM_BASE_URL")
+    if vllm_base_url:
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(
+            base_url=vllm_base_url,
+            api_key=os.getenv("VLLM_API_KEY", "EMPTY"),
+            model=os.getenv("VLLM_MODEL", "meta-llama/Llama-3.3-70B-Instruct"),
+            temperature=temperature
+        )
+
     return ChatGroq(
         groq_api_key=os.getenv("GROQ_API_KEY"),
         model="llama-3.3-70b-versatile",
         temperature=temperature
     )
 
+def cached_search(vectordb, document_id, query, k):
+    """
+    similarity_search_with_score memoized in Mongo per (document_id, k, query).
+
+    Safe while the document is unchanged: the cache key includes the
+    document's corpus_version, so bumping it on re-upload invalidates
+    every stale entry at once.
+    """
+    doc = documents_col.find_one({"_id": document_id}, {"corpus_version": 1})
+    corpus_version = (doc or {}).get("corpus_version", 1)
+
+    key = hashlib.sha256(
+        f"{document_id}|{k}|{corpus_version}|{query}".encode()
+    ).hexdigest()
+
+    cached = retrieval_cache_col.find_one({"_id": key})
+    if cached:
+        return [
+            (Document(page_content=e["page_content"], metadata=e.get("metadata", {})),
+             e["score"])
+            for e in cached["results"]
+        ]
+
+    results = vectordb.similarity_search_with_score(query, k=k)
+
+    # Upsert rather than insert: two concurrent misses on the same key would
+    # otherwise race to insert_one and the loser would raise DuplicateKeyError
+    retrieval_cache_col.replace_one(
+        {"_id": key},
+        {
+            "_id": key,
+            "document_id": document_id,
+            "results": [
+                {
+                    "page_content": d.page_content,
+                    "metadata": d.metadata,
+                    "score": float(score)
+                }
+                for d, score in results
+            ],
+            "created_at": datetime.now()
+        },
+        upsert=True
+    )
+
+    return results
+
+def order_chunks(docs):
+    """
+    Sort retrieved chunks by their position in the document so the context
+    string is byte-identical across requests and prefix caches can hit.
+    """
+    return sorted(docs, key=lambda d: d.metadata.get("chunk", 0))
+
 def store_document(username, title, content_type, transcript_text,
                    chunk_size=1000, chunk_overlap=200):
     document_id = str(uuid.uuid4())
     faiss_path = f"{FAISS_DIR}/{username}_{document_id}"
 
     chunks = chunk_text(transcript_text, chunk_size, chunk_overlap)
-    vectordb = FAISS.from_documents(chunks, embedding=embedding_model)
+    for i, chunk in enumerate(chunks):
+        chunk.metadata["chunk"] = i
+
+    texts = [c.page_content for c in chunks]
+    vectors = st_model.encode(
+        texts,
+        batch_size=64,
+        show_progress_bar=False,
+        convert_to_numpy=True,
+        normalize_embeddings=True
+    )
+
+    vectordb = build_vectorstore(chunks, vectors)
     vectordb.save_local(faiss_path)
 
+    # Notes generation always uses the same fixed query, so retrieval would
+    # return the same top-k every time; precompute that context once here
+    notes_context = "\n\n".join(c.page_content for c in chunks[:5])
+
     documents_col.insert_one({
         "_id": document_id,
         "username": username,
@@ -55,55 +328,116 @@ def store_document(username, title, content_type, transcript_text,
             "chunk_size": chunk_size,
             "chunk_overlap": chunk_overlap
         },
+        "corpus_version": 1,
+        "notes_context": notes_context,
         "created_at": datetime.now()
     })
 
     return document_id
 
-def load_retriever(username, document_id, k=5):
+@lru_cache(maxsize=64)
+def _load_vectorstore(username, document_id):
+    # FAISS.load_local deserializes the whole index from disk, so keep the
+    # loaded vectorstore around per (username, document_id). Re-uploads get
+    # a fresh document_id, so entries never go stale.
     doc = documents_col.find_one({
         "_id": document_id,
         "username": username
     })
 
-    vectordb = FAISS.load_local(
+    return FAISS.load_local(
         folder_path=doc["faiss_path"],
         embeddings=embedding_model,
         allow_dangerous_deserialization=True
     )
 
+def load_retriever(username, document_id, k=5):
+    vectordb = _load_vectorstore(username, document_id)
     return vectordb.as_retriever(search_kwargs={"k": k})
 
 def generate_notes(document_id, username, prompt_template,
                    chunk_size=1000, chunk_overlap=200, retriever_k=5, llm_temperature=0.7):
-    retriever = load_retriever(username=username, document_id=document_id, k=retriever_k)
     llm = get_llm(llm_temperature)
 
-    docs = retriever.invoke("Generate structured lecture notes.")
-    context = "\n\n".join(d.page_content for d in docs)
+    # CAG path: documents store a precomputed notes context, so the FAISS
+    # load + search can be skipped entirely
+    doc = documents_col.find_one(
+        {"_id": document_id, "username": username},
+        {"notes_context": 1}
+    )
+    context = (doc or {}).get("notes_context")
+
+    if not context:
+        retriever = load_retriever(username=username, document_id=document_id, k=retriever_k)
+        docs_with_scores = cached_search(
+            retriever.vectorstore, document_id,
+            "Generate structured lecture notes.", k=retriever_k
+        )
+        docs = [d for d, _ in docs_with_scores]
+        context = "\n\n".join(d.page_content for d in order_chunks(docs))
 
     prompt = prompt_template.format(context=context)
     response = llm.invoke(prompt).content
 
     return response
 
+def save_chat_messages(session_id, user_query, answer, background_tasks=None):
+    """
+    Persist a human/assistant message pair. Both docs share one timestamp
+    (the assistant offset by a microsecond so sorts stay strictly ordered)
+    and Mongo assigns the ObjectIds. When background_tasks is given, the
+    insert runs after the response is sent instead of on the request path.
+    """
+    now = datetime.utcnow()
+    docs = [
+        {
+            "session_id": session_id,
+            "role": "human",
+            "content": user_query,
+            "timestamp": now
+        },
+        {
+            "session_id": session_id,
+            "role": "assistant",
+            "content": answer,
+            "timestamp": now + timedelta(microseconds=1)
+        }
+    ]
+
+    if background_tasks is not None:
+        background_tasks.add_task(messages_col.insert_many, docs)
+    else:
+        messages_col.insert_many(docs)
+
 def chat_with_transcript(
     user_query: str,
     session_id: str,
     retriever,
-    notes_context: str | None = None
+    notes_context: str | None = None,
+    document_id: str | None = None,
+    background_tasks=None
 ):
     llm = get_llm()
 
+    # -----------------------------
+    # Semantic answer cache
+    # -----------------------------
+    query_embedding = embedding_model.embed_query(user_query)
+
+    cached_answer = answer_cache.lookup(session_id, query_embedding)
+    if cached_answer is not None:
+        save_chat_messages(session_id, user_query, cached_answer, background_tasks)
+        return cached_answer
+
     # -----------------------------
     # Load chat history
     # -----------------------------
     chat_docs = messages_col.find(
         {"session_id": session_id}
-    ).sort("timestamp", 1)
+    ).sort("timestamp", -1).limit(2 * CHAT_HISTORY_TURNS)
 
     chat_history = []
-    for msg in chat_docs:
+    for msg in reversed(list(chat_docs)):
         if msg["role"] == "human":
             chat_history.append(HumanMessage(content=msg["content"]))
         else:
@@ -112,16 +446,20 @@ def chat_with_transcript(
     # -----------------------------
     # Retrieve WITH SCORES ✅
     # -----------------------------
-    docs_with_scores = retriever.vectorstore.similarity_search_with_score(
-        user_query, k=3
+    docs_with_scores = cached_search(
+        retriever.vectorstore, document_id, user_query, k=3
     )
 
     top_score = docs_with_scores[0][1]
+    # Both sides of the search are unit-normalized, so FAISS's squared L2
+    # score is 2 - 2*cosine; 1.0 gates at cosine similarity 0.5
     SIMILARITY_THRESHOLD = 1.0
 
     is_out_of_context = top_score > SIMILARITY_THRESHOLD
 
-    context = "\n\n".join(doc.page_content for doc, _ in docs_with_scores)
+    context = "\n\n".join(
+        doc.page_content for doc in order_chunks([doc for doc, _ in docs_with_scores])
+    )
 
     # -----------------------------
     # If OUT OF CONTEXT → fallback FIRST
@@ -145,60 +483,26 @@ def chat_with_transcript(
             f"{general_response}\n"
         )
 
-        messages_col.insert_many([
-            {
-                "_id": str(uuid.uuid4()),
-                "session_id": session_id,
-                "role": "human",
-                "content": user_query,
-                "timestamp": datetime.now()
-            },
-            {
-                "_id": str(uuid.uuid4()),
-                "session_id": session_id,
-                "role": "assistant",
-                "content": general_final_response,
-                "timestamp": datetime.now()
-            }
-        ])
+        save_chat_messages(
+            session_id, user_query, general_final_response, background_tasks
+        )
 
         return general_final_response
 
     # -----------------------------
     # Otherwise → RAG answer
     # -----------------------------
-    prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system", "Answer strictly using the provided context."),
-            ("system", "Context:\n{context}"),
-            *[(m.type, m.content) for m in chat_history],
-            ("human", "{question}")
-        ]
-    )
-
-    formatted_prompt = prompt.format_messages(
+    formatted_prompt = RAG_CHAT_PROMPT.format_messages(
         context=context,
-        question=user_query
+        question=user_query,
+        history=chat_history
     )
 
     response = llm.invoke(formatted_prompt).content
 
-    messages_col.insert_many([
-        {
-            "_id": str(uuid.uuid4()),
-            "session_id": session_id,
-            "role": "human",
-            "content": user_query,
-            "timestamp": datetime.now()
-        },
-        {
-            "_id": str(uuid.uuid4()),
-            "session_id": session_id,
-            "role": "assistant",
-            "content": response,
-            "timestamp": datetime.now()
-        }
-    ])
+    save_chat_messages(session_id, user_query, response, background_tasks)
+
+    answer_cache.add(session_id, document_id, query_embedding, response)
 
     return response
 
@@ -1,9 +1,21 @@
+import os
 import re
+import shutil
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from typing import IO
 
 import pdfplumber
 from fastapi import UploadFile, HTTPException
 
+# Compiled once at import so load_srt doesn't pay pattern parsing per upload
+_SRT_TIMESTAMPS = re.compile(
+    r"\d+\s*\n\d{2}:\d{2}:\d{2},\d{3}\s-->\s\d{2}:\d{2}:\d{2},\d{3}"
+)
+_BLANK_LINES = re.compile(r"\n{2,}")
+
 
 def load_txt(file: IO) -> str:
     """
@@ -18,31 +30,72 @@ def load_txt(file: IO) -> str:
         )
 
 
-def load_pdf(file: IO) -> str:
+_PDF_POOL = None
+_PDF_POOL_LOCK = threading.Lock()
+
+
+def _pdf_pool() -> ProcessPoolExecutor:
     """
-    Load PDF files using pdfplumber
+    Shared process pool for page extraction, created lazily on first use.
+    Workers are spawned rather than forked so they don't inherit the
+    running server's threads and locks, and the pool is reused across
+    uploads instead of paying startup/teardown per request.
     """
-    text = ""
+    global _PDF_POOL
+    with _PDF_POOL_LOCK:
+        if _PDF_POOL is None:
+            _PDF_POOL = ProcessPoolExecutor(
+                max_workers=os.cpu_count() or 1,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+    return _PDF_POOL
 
+
+def _extract_page(args: tuple) -> str:
+    """
+    Extract text from a single page. Runs in a worker process, so it opens
+    its own pdfplumber handle (page objects aren't picklable).
+    """
+    file_path, page_number = args
+    with pdfplumber.open(file_path) as pdf:
+        return pdf.pages[page_number].extract_text() or ""
+
+
+def load_pdf(file_path: str) -> str:
+    """
+    Load PDF files from disk using pdfplumber, extracting pages in parallel
+    """
     try:
-        with pdfplumber.open(file) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
+        with pdfplumber.open(file_path) as pdf:
+            page_count = len(pdf.pages)
+
+        page_args = [(file_path, i) for i in range(page_count)]
+
+        if page_count > 1:
+            # extract_text is CPU-bound and pages are independent, so fan
+            # out across cores; executor.map preserves page order
+            page_texts = list(_pdf_pool().map(_extract_page, page_args))
+        else:
+            page_texts = [_extract_page(args) for args in page_args]
     except Exception:
         raise HTTPException(
             status_code=400,
             detail="Failed to read PDF file."
         )
 
-    if not text.strip():
+    # Accumulate per-page text and join once: += on a growing string is
+    # quadratic in the total output length
+    parts = [t for t in page_texts if t]
+
+    text = "\n".join(parts).strip()
+
+    if not text:
         raise HTTPException(
             status_code=400,
             detail="No readable text found in PDF."
         )
 
-    return text.strip()
+    return text
 
 
 def load_srt(file: IO) -> str:
@@ -58,14 +111,10 @@ def load_srt(file: IO) -> str:
         )
 
     # Remove subtitle index + timestamps
-    content = re.sub(
-        r"\d+\s*\n\d{2}:\d{2}:\d{2},\d{3}\s-->\s\d{2}:\d{2}:\d{2},\d{3}",
-        "",
-        content
-    )
+    content = _SRT_TIMESTAMPS.sub("", content)
 
     # Remove extra blank lines
-    content = re.sub(r"\n{2,}", "\n", content)
+    content = _BLANK_LINES.sub("\n", content)
 
     cleaned_text = content.strip()
 
@@ -78,32 +127,55 @@ def load_srt(file: IO) -> str:
     return cleaned_text
 
 
-def load_transcript(file: UploadFile) -> str:
+def load_transcript_file(file_path: str, filename: str) -> str:
     """
-    Detect file type and load transcript text safely
+    Detect file type and load transcript text from a file already on disk
     """
-    if not file.filename:
+    if not filename:
         raise HTTPException(
             status_code=400,
             detail="Uploaded file has no filename."
         )
 
-    filename = file.filename.lower()
-
-    # Reset stream pointer (IMPORTANT)
-    file.file.seek(0)
+    filename = filename.lower()
 
     if filename.endswith(".txt"):
-        return load_txt(file.file)
+        with open(file_path, "rb") as f:
+            return load_txt(f)
 
     elif filename.endswith(".pdf"):
-        return load_pdf(file.file)
+        return load_pdf(file_path)
 
     elif filename.endswith(".srt"):
-        return load_srt(file.file)
+        with open(file_path, "rb") as f:
+            return load_srt(f)
 
     else:
         raise HTTPException(
             status_code=400,
             detail="Unsupported file format. Allowed formats: .txt, .pdf, .srt"
         )
+
+
+def load_transcript(file: UploadFile) -> str:
+    """
+    Detect file type and load transcript text safely
+    """
+    if not file.filename:
+        raise HTTPException(
+            status_code=400,
+            detail="Uploaded file has no filename."
+        )
+
+    # Reset stream pointer (IMPORTANT), then stream the upload to a tempfile
+    # in 1 MiB chunks so the whole file is never buffered in memory at once
+    file.file.seek(0)
+
+    tmp = tempfile.NamedTemporaryFile(delete=False)
+    try:
+        shutil.copyfileobj(file.file, tmp, length=1 << 20)
+        tmp.close()
+        return load_transcript_file(tmp.name, file.filename)
+    finally:
+        tmp.close()
+        os.unlink(tmp.name)